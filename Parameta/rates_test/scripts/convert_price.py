@@ -1,46 +1,104 @@
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import pyarrow.parquet as pq
 import numpy as np
-from typing import Optional
+from typing import Optional, List
 import os
 import psutil
 import time
 
+# Remark codes kept as int8 while flagging; REMARKS[code] is the text written out.
+NO_REMARK = 0
+MISSING_PRICE = 1
+CCY_PAIR_NOT_FOUND = 2
+INVALID_CCY_PAIR = 3
+MISSING_CONVERSION_FACTOR = 4
+CONVERSION_NOT_REQUIRED = 5
+MISSING_SPOT_RATE = 6
+SPOT_RATE_TOO_OLD = 7
+CONVERTED = 8
+
+HOUR_NS = 3_600_000_000_000
+
+REMARKS = [
+    '',
+    'Missing price',
+    'ccy_pair not found in ccy_df',
+    'Missing or invalid ccy_pair',
+    'Missing conversion_factor',
+    'Conversion not required',
+    'Missing spot_mid_rate',
+    'Spot rate too old (>1hr)',
+    'Converted',
+]
+
 
 class PriceConverter:
     """Handles price conversion logic including data loading, spot merging, validation, and export."""
 
     def __init__(self, price_path: str, spot_path: str, ccy_path: str):
         """Initializes and loads all input files from provided paths."""
-        self.ccy_df = pd.read_csv(ccy_path)
-        self.price_df = pq.read_table(price_path).to_pandas()
-        self.spot_rate_df = pq.read_table(spot_path).to_pandas()
+        self.ccy_df = pd.read_csv(ccy_path, usecols=['ccy_pair', 'convert_price', 'conversion_factor'])
+        self.price_df = self._read_parquet(
+            price_path, ['timestamp', 'security_id', 'price', 'ccy_pair'], categories=['security_id', 'ccy_pair']
+        )
+        self.spot_rate_df = self._read_parquet(
+            spot_path, ['timestamp', 'ccy_pair', 'spot_mid_rate'], categories=['ccy_pair']
+        )
 
-        # Standardize and convert timestamps
+        # Standardize and convert timestamps (renamed in place, no frame copies)
         self.price_df['timestamp'] = pd.to_datetime(self.price_df['timestamp'])
         self.spot_rate_df['timestamp'] = pd.to_datetime(self.spot_rate_df['timestamp'])
-        self.price_df = self.price_df.rename(columns={'timestamp': 'price_timestamp'})
-        self.spot_rate_df = self.spot_rate_df.rename(columns={'timestamp': 'spot_timestamp'})
+        self.price_df.rename(columns={'timestamp': 'price_timestamp'}, inplace=True)
+        self.spot_rate_df.rename(columns={'timestamp': 'spot_timestamp'}, inplace=True)
+
+        # Share one categorical dtype for ccy_pair so joins hash small int codes, not strings.
+        # Categories cover every pair seen, so pairs missing from ccy_df are kept as-is.
+        ccy_pairs = pd.concat([
+            self.ccy_df['ccy_pair'], self.price_df['ccy_pair'], self.spot_rate_df['ccy_pair']
+        ]).dropna().unique()
+        ccy_dtype = pd.CategoricalDtype(categories=ccy_pairs)
+        for df in (self.ccy_df, self.price_df, self.spot_rate_df):
+            df['ccy_pair'] = df['ccy_pair'].astype(ccy_dtype)
+
+        # Spot rates are only ever used ordered by time; sort them once, and only if needed
+        if not self.spot_rate_df['spot_timestamp'].is_monotonic_increasing:
+            self.spot_rate_df = self.spot_rate_df.sort_values('spot_timestamp', ignore_index=True)
 
         self.result_df: Optional[pd.DataFrame] = None
 
-    def _merge_conversion_factors(self) -> pd.DataFrame:
-        """Joins price_df with ccy_df to bring in conversion metadata."""
-        return self.price_df.merge(
-            self.ccy_df[['ccy_pair', 'convert_price', 'conversion_factor']],
-            on='ccy_pair',
-            how='left'
+    @staticmethod
+    def _read_parquet(path: str, columns: List[str], categories: List[str]) -> pd.DataFrame:
+        """
+        Reads only the needed columns, releasing Arrow buffers as pandas takes them over.
+        String key columns in `categories` come back as int-coded categoricals, not Python strings.
+        """
+        table = pq.read_table(
+            path, columns=columns, read_dictionary=categories, pre_buffer=True, use_threads=True
         )
+        return table.to_pandas(categories=categories, self_destruct=True, split_blocks=True)
+
+    def _merge_conversion_factors(self) -> pd.DataFrame:
+        """Attaches conversion metadata to price_df via dict lookups on the small ccy_df (no merge)."""
+        cv_map = dict(zip(self.ccy_df['ccy_pair'], self.ccy_df['convert_price']))
+        cf_map = dict(zip(self.ccy_df['ccy_pair'], self.ccy_df['conversion_factor']))
+
+        # Pairs missing from ccy_df map to NaN, same as the left join did
+        self.price_df['convert_price'] = self.price_df['ccy_pair'].map(cv_map).astype(object)
+        self.price_df['conversion_factor'] = self.price_df['ccy_pair'].map(cf_map).astype(np.float64)
+        return self.price_df
     
     def _get_latest_spot_rates(self, merged_df: pd.DataFrame) -> pd.DataFrame:
         """Performs merge_asof to attach latest spot rate for each price timestamp."""
-        merged_sorted = merged_df.sort_values('price_timestamp')
-        spot_sorted = self.spot_rate_df.sort_values('spot_timestamp')
+        merged_sorted = merged_df
+        if not merged_sorted['price_timestamp'].is_monotonic_increasing:
+            merged_sorted = merged_df.sort_values('price_timestamp', ignore_index=True)
 
-        # Perform merge_asof with left_on and right_on
+        # Perform merge_asof with left_on and right_on (spot_rate_df is kept sorted)
         enriched = pd.merge_asof(
             merged_sorted,
-            spot_sorted,
+            self.spot_rate_df,
             left_on='price_timestamp',
             right_on='spot_timestamp',
             by='ccy_pair',
@@ -48,61 +106,40 @@ class PriceConverter:
         )
         return enriched
     
-    def _flag_conversion_issues(self, enriched: pd.DataFrame) -> pd.DataFrame:
-        """Assigns appropriate remark flags based on conversion logic rules."""
-
-        # Step 1: Flag missing price
-        enriched.loc[enriched['price'].isnull(), 'remark'] = 'Missing price'
-
-        # Step 2: Flag ccy_pair not found in ccy_df
-        cond_not_found = (
-            (enriched['remark'] == '') &
-            (enriched['convert_price'].isnull()) &
-            (enriched['conversion_factor'].isnull()) &
-            (enriched['ccy_pair'].notnull())
-        )
-        enriched.loc[cond_not_found, 'remark'] = 'ccy_pair not found in ccy_df'
-
-        # Step 3: Flag missing or invalid ccy_pair
-        enriched.loc[
-            enriched['ccy_pair'].isnull() | (enriched['ccy_pair'].str.strip() == ''),
-            'remark'
-        ] = 'Missing or invalid ccy_pair'
-
-        # Step 4: Flag missing conversion factor when required
-        cond_cf_missing = (
-            (enriched['convert_price'] == True) &
-            (enriched['conversion_factor'].isnull()) &
-            (enriched['remark'] == '')
-        )
-        enriched.loc[cond_cf_missing, 'remark'] = 'Missing conversion_factor'
-
-        # Step 5: Flag conversion not required
-        cond_cf_false = (
-            (enriched['convert_price'] == False) &
-            (enriched['remark'] == '')
-        )
-        enriched.loc[cond_cf_false, 'remark'] = 'Conversion not required'
-
-        # Step 6: Flag missing spot rate when all else is valid
-        cond_spot_missing = (
-            (enriched['convert_price'] == True) &
-            (enriched['conversion_factor'].notnull()) &
-            (enriched['spot_mid_rate'].isnull()) &
-            (enriched['remark'] == '')
-        )
-        enriched.loc[cond_spot_missing, 'remark'] = 'Missing spot_mid_rate'
-
-        # Step 7: Flag spot rate too old
-        time_diff = enriched['price_timestamp'] - enriched['spot_timestamp']
-        cond_spot_out_of_window = (
-            (enriched['remark'] == '') &
-            (enriched['convert_price'] == True) &
-            (enriched['conversion_factor'].notnull()) &
-            (enriched['spot_mid_rate'].notnull()) &
-            (time_diff > pd.Timedelta(hours=1))
-        )
-        enriched.loc[cond_spot_out_of_window, 'remark'] = 'Spot rate too old (>1hr)'
+    def _flag_conversion_issues(self, enriched: pd.DataFrame, diff_ns: np.ndarray) -> pd.DataFrame:
+        """Assigns appropriate remark codes based on conversion logic rules, in a single np.select pass."""
+        price_missing = enriched['price'].isnull().to_numpy()
+        ccy_invalid = (
+            enriched['ccy_pair'].isnull() | (enriched['ccy_pair'].str.strip() == '')
+        ).to_numpy()
+        convert = enriched['convert_price'].to_numpy()
+        convert_missing = pd.isnull(convert)
+        convert_true = convert == True
+        convert_false = convert == False
+        cf_present = enriched['conversion_factor'].notnull().to_numpy()
+        spot_present = enriched['spot_mid_rate'].notnull().to_numpy()
+
+        # Conditions in priority order; the first match wins. A missing or invalid
+        # ccy_pair overrides every other remark, then missing price, and so on.
+        conds = [
+            ccy_invalid,
+            price_missing,
+            convert_missing & ~cf_present,                  # ccy_pair not found in ccy_df
+            convert_true & ~cf_present,
+            convert_false,
+            convert_true & cf_present & ~spot_present,
+            convert_true & cf_present & spot_present & (diff_ns > HOUR_NS),
+        ]
+        codes = [
+            INVALID_CCY_PAIR,
+            MISSING_PRICE,
+            CCY_PAIR_NOT_FOUND,
+            MISSING_CONVERSION_FACTOR,
+            CONVERSION_NOT_REQUIRED,
+            MISSING_SPOT_RATE,
+            SPOT_RATE_TOO_OLD,
+        ]
+        enriched['remark_code'] = np.select(conds, codes, default=NO_REMARK).astype(np.int8)
 
         return enriched
 
@@ -114,29 +151,37 @@ class PriceConverter:
         print("  Step 2: Attaching latest spot rates...")
         enriched = self._get_latest_spot_rates(merged_df)
 
-        print("  Step 3: Initializing columns...")
-        enriched['remark'] = ''
-        enriched['converted_price'] = enriched['price']
+        print("  Step 3: Computing spot rate age...")
+        # price-to-spot age as raw int64 nanoseconds (only meaningful where a spot rate was found)
+        price_ns = enriched['price_timestamp'].to_numpy(dtype='datetime64[ns]').view('i8')
+        spot_ns = enriched['spot_timestamp'].to_numpy(dtype='datetime64[ns]').view('i8')
+        diff_ns = price_ns - spot_ns
 
         print("  Step 4: Flagging conversion issues...")
-        enriched = self._flag_conversion_issues(enriched)
+        enriched = self._flag_conversion_issues(enriched, diff_ns)
 
         print("  Step 5: Calculating valid converted prices...")
-        time_diff = enriched['price_timestamp'] - enriched['spot_timestamp']
+        price = enriched['price'].to_numpy()
+        conversion_factor = enriched['conversion_factor'].to_numpy()
+        spot_mid_rate = enriched['spot_mid_rate'].to_numpy()
+        remark_code = enriched['remark_code'].to_numpy()
         cond_valid = (
-            (enriched['remark'] == '') &
-            (enriched['convert_price'] == True) &
-            (enriched['conversion_factor'].notnull()) &
-            (enriched['spot_mid_rate'].notnull()) &
-            (time_diff.between(pd.Timedelta(0), pd.Timedelta(hours=1)))
+            (remark_code == NO_REMARK) &
+            (enriched['convert_price'] == True).to_numpy() &
+            ~np.isnan(conversion_factor) &
+            ~np.isnan(spot_mid_rate) &
+            (diff_ns >= 0) & (diff_ns <= HOUR_NS)
         )
 
-        enriched.loc[cond_valid, 'converted_price'] = (
-            enriched.loc[cond_valid, 'price'] / 
-            enriched.loc[cond_valid, 'conversion_factor'] +
-            enriched.loc[cond_valid, 'spot_mid_rate']
-        )
-        enriched.loc[cond_valid, 'remark'] = 'Converted'
+        # One fused pass over full arrays; rows that are not converted keep their price
+        with np.errstate(divide='ignore', invalid='ignore'):
+            enriched['converted_price'] = np.where(
+                cond_valid, price / conversion_factor + spot_mid_rate, price
+            )
+        enriched['remark_code'] = np.where(cond_valid, CONVERTED, remark_code).astype(np.int8)
+
+        # Materialize remark text only once, as a categorical over the codes
+        enriched['remark'] = pd.Categorical.from_codes(enriched['remark_code'], categories=REMARKS)
 
         self.result_df = enriched[[
             'price_timestamp', 'security_id', 'ccy_pair', 'price', 'conversion_factor',
@@ -147,7 +192,11 @@ class PriceConverter:
         """Saves the computed result DataFrame to a CSV file."""
         if self.result_df is None:
             raise ValueError("No results to save. Run calculate_converted_prices() first.")
-        self.result_df.to_csv(output_path, index=False)
+        # Arrow's multithreaded C++ writer instead of pandas' Python-level row formatter
+        pacsv.write_csv(
+            pa.Table.from_pandas(self.result_df, preserve_index=False), output_path,
+            write_options=pacsv.WriteOptions(batch_size=65536)  # default of 1024 rows per batch is small
+        )
         print(f"Result saved to: {output_path}")
     
 def log_performance(converter: PriceConverter, output_path: str, start_time: float) -> None:
@@ -0,0 +1,82 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+import convert_price as cp
+from convert_price import PriceConverter
+
+# convert_price is empty for CHFUSD, and AUDUSD never gets a spot rate
+CCY_CSV = """ccy_pair,convert_price,conversion_factor
+EURUSD,True,10
+GBPUSD,False,
+JPYUSD,True,
+CHFUSD,,5
+AUDUSD,True,2
+"""
+
+# security_id -> (price time, price, ccy_pair, expected remark code, expected converted price).
+# Expectations are what the original seven-step overwrite cascade produced.
+CASES = {
+    'converted':             ('10:00', 100.0, 'EURUSD', cp.CONVERTED, 100.0 / 10 + 1.1),
+    'spot_exactly_1h':       ('10:30', 200.0, 'EURUSD', cp.CONVERTED, 200.0 / 10 + 1.1),
+    'spot_too_old':          ('10:31', 300.0, 'EURUSD', cp.SPOT_RATE_TOO_OLD, 300.0),
+    'price_before_spot':     ('09:00', 400.0, 'EURUSD', cp.MISSING_SPOT_RATE, 400.0),
+    'missing_price':         ('10:00', np.nan, 'EURUSD', cp.MISSING_PRICE, np.nan),
+    'not_found':             ('10:00', 5.0, 'XXXYYY', cp.CCY_PAIR_NOT_FOUND, 5.0),
+    'missing_price_unknown': ('10:00', np.nan, 'XXXYYY', cp.MISSING_PRICE, np.nan),
+    'invalid_pair':          ('10:00', 7.0, None, cp.INVALID_CCY_PAIR, 7.0),
+    'missing_price_blank':   ('10:00', np.nan, ' ', cp.INVALID_CCY_PAIR, np.nan),
+    'no_conversion':         ('10:00', 8.0, 'GBPUSD', cp.CONVERSION_NOT_REQUIRED, 8.0),
+    'missing_factor':        ('10:00', 9.0, 'JPYUSD', cp.MISSING_CONVERSION_FACTOR, 9.0),
+    'missing_spot':          ('10:00', 11.0, 'AUDUSD', cp.MISSING_SPOT_RATE, 11.0),
+    'convert_nan_factor':    ('10:00', 12.0, 'CHFUSD', cp.NO_REMARK, 12.0),
+}
+
+
+def _run_converter(tmp):
+    price_path = os.path.join(tmp, 'price.parq')
+    spot_path = os.path.join(tmp, 'spot.parq')
+    ccy_path = os.path.join(tmp, 'ccy.csv')
+
+    pd.DataFrame({
+        'timestamp': pd.to_datetime([f"2021-11-20 {t}" for t, *_ in CASES.values()]),
+        'security_id': list(CASES),
+        'price': [p for _, p, *_ in CASES.values()],
+        'ccy_pair': [c for _, _, c, *_ in CASES.values()],
+    }).to_parquet(price_path)
+    pd.DataFrame({
+        'timestamp': pd.to_datetime(['2021-11-20 09:30', '2021-11-20 09:30', '2021-11-20 09:30']),
+        'ccy_pair': ['EURUSD', 'JPYUSD', 'CHFUSD'],
+        'spot_mid_rate': [1.1, 2.2, 3.3],
+    }).to_parquet(spot_path)
+    with open(ccy_path, 'w') as f:
+        f.write(CCY_CSV)
+
+    converter = PriceConverter(price_path=price_path, spot_path=spot_path, ccy_path=ccy_path)
+    converter.calculate_converted_prices()
+    return converter.result_df.set_index(converter.result_df['security_id'].astype(str))
+
+
+def test_every_remark_and_overlap():
+    with tempfile.TemporaryDirectory() as tmp:
+        result = _run_converter(tmp)
+
+    assert len(result) == len(CASES)
+    for sec, (_, _, _, code, converted) in CASES.items():
+        row = result.loc[sec]
+        assert row['remark'] == cp.REMARKS[code], (sec, row['remark'])
+        np.testing.assert_allclose(row['converted_price'], converted, rtol=1e-12, err_msg=sec)
+
+
+def test_every_remark_is_covered():
+    assert {case[3] for case in CASES.values()} == set(range(len(cp.REMARKS)))
+
+
+if __name__ == '__main__':
+    test_every_remark_and_overlap()
+    test_every_remark_is_covered()
+    print("OK")
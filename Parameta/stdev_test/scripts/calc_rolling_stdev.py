@@ -1,9 +1,10 @@
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import pyarrow.parquet as pq
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 import numpy as np
-from collections import deque
-import math
+from numpy.lib.stride_tricks import sliding_window_view
 import time
 import os
 import psutil
@@ -11,20 +12,36 @@ import psutil
 
 class RollingPriceStdevCalculator:
     """
-    Rolling stdev for bid/mid/ask per security_id using the most recent block
-    of 20 contiguous hourly snaps strictly before each snap_time.
+    Rolling stdev for bid/mid/ask per security_id using the last 20 valid
+    (non-NaN) snaps of that security strictly before each snap_time.
 
     Rules implemented:
       - Work on a complete hourly calendar per security in the [start, end] range.
-      - Missing snaps remain as rows (prices NaN), but we still compute stdev
-        at those times using the last contiguous 20 valid snaps that occurred earlier.
+      - Missing snaps remain as rows (prices NaN) and are skipped, not counted:
+        they do not reset the window, and stdev is still computed at those times
+        from the last 20 valid snaps that occurred earlier.
       - A window never includes the current row's value.
-      - If < 20 contiguous valid values exist yet, result is NaN.
+      - If < 20 valid values exist before a row, result is NaN.
+
+    Stdevs are computed for every security at once, two-pass (mean, then squared
+    deviations) over a strided view of each column's valid values (no per-row
+    Python loop).
     """
+    # the only columns read from Parquet and carried through the pipeline
+    KEY_COLS = ['snap_time', 'security_id']
+    PRICE_COLS = ['bid', 'mid', 'ask']
+    # windows per slab in _window_stdevs; bounds the (cols, block, window) temporary
+    WINDOW_BLOCK = 65536
+
     def __init__(self, file_path: str):
-        """Initializes the calculator and loads data from a Parquet file."""
+        """Initializes the calculator and loads the needed columns from a Parquet file."""
         self.file_path = file_path
-        self.price_df = pq.read_table(file_path).to_pandas()
+        table = pq.read_table(
+            file_path, columns=self.KEY_COLS + self.PRICE_COLS,
+            read_dictionary=['security_id'], pre_buffer=True, use_threads=True
+        )
+        # security_id stays dictionary-encoded: a categorical with int codes, not Python strings
+        self.price_df = table.to_pandas(categories=['security_id'], self_destruct=True, split_blocks=True)
         self.result_df = None
 
     @staticmethod
@@ -33,8 +50,20 @@ class RollingPriceStdevCalculator:
 
     def _preprocess(self) -> None:
         """Converts timestamps and sorts the dataframe by security_id and snap_time."""
-        self.price_df['snap_time'] = pd.to_datetime(self.price_df['snap_time'])
-        self.price_df.sort_values(['security_id', 'snap_time'], inplace=True)
+        # Parquet normally stores snap_time as a timestamp already; only parse when it doesn't
+        if self.price_df['snap_time'].dtype.kind != 'M':
+            self.price_df['snap_time'] = pd.to_datetime(self.price_df['snap_time'])
+        # order categories lexically so sorting by the codes matches sorting by the ids
+        self.price_df['security_id'] = self.price_df['security_id'].cat.reorder_categories(
+            np.sort(self.price_df['security_id'].cat.categories)
+        )
+
+        # Sort on (security code, int64 time) with NumPy, and skip it when the file is already sorted
+        codes = self.price_df['security_id'].cat.codes.to_numpy()
+        times = self.price_df['snap_time'].to_numpy().view('i8')
+        code_step, time_step = np.diff(codes), np.diff(times)
+        if not np.all((code_step > 0) | ((code_step == 0) & (time_step >= 0))):
+            self.price_df = self.price_df.take(np.lexsort((times, codes)))
         self.price_df.reset_index(drop=True, inplace=True)
 
     def _expand_to_full_grid(self, start, end) -> pd.DataFrame:
@@ -44,84 +73,114 @@ class RollingPriceStdevCalculator:
 
         full_idx = self._hourly_index(start_ts, end_ts)
 
-        out = []
-        for sec_id, g in self.price_df.groupby('security_id', sort=False):
-            g = g.set_index('snap_time').sort_index() # assume snap_time contains no duplicates 
-            g = g.reindex(full_idx)  # adds missing hours
-            g['security_id'] = sec_id
-            g.index.name = 'snap_time'
-            g.reset_index(inplace=True)
-            out.append(g)
+        # one global reindex onto (security_id x hour); assume snap_time contains no duplicates
+        sec_ids = self.price_df['security_id'].unique()
+        grid = pd.MultiIndex.from_product([sec_ids, full_idx], names=['security_id', 'snap_time'])
+        out = self.price_df.set_index(['security_id', 'snap_time']).reindex(grid).reset_index()
+        return out[self.KEY_COLS + self.PRICE_COLS]
+
+    @staticmethod
+    def _get_valid_window_indices(valid: np.ndarray, bounds: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized window check for one column over all security_ids.
+        Rows must be grouped by security_id and time-ordered; security g spans
+        rows bounds[g]:bounds[g+1].
+        Returns the row positions that have at least `window` valid values
+        strictly before them within the same security_id, and for each of
+        them where its window starts among the valid values.
+        """
+        prior_valid = np.concatenate(([0], np.cumsum(valid)[:-1]))
 
-        return pd.concat(out, ignore_index=True)
+        # valid count carried in from earlier securities, repeated over each group
+        group_base = np.repeat(prior_valid[bounds[:-1]], np.diff(bounds))
+        idx = np.flatnonzero(prior_valid - group_base >= window)
+        return idx, prior_valid[idx] - window
 
     @staticmethod
-    def _rolling_stdev_with_deques(group_df, cols, window=20, eps=1e-8) -> pd.DataFrame: 
+    def _window_stdevs(x: np.ndarray, window: int, block: Optional[int] = None) -> np.ndarray:
         """
-        Single pass over time for one security_id.
-        For each column, maintain a deque of the most recent contiguous valid values.
-        Compute stdev at time t using the deque before considering row t's value.
+        Population stdev of every full window x[:, k:k+window] for a (cols, n)
+        block of columns. Each window is a strided view, and its variance is taken
+        two-pass (mean first, then squared deviations from that mean), exactly as
+        the per-row deque computation did, so a price drifting far from the
+        rest of its history cannot cancel away the window's own variance.
+        Windows spanning two securities are computed too; callers never pick them.
+
+        np.std materializes x - mean for every window it is given, so windows are
+        taken `block` at a time (default WINDOW_BLOCK): peak temporary memory is
+        O(cols * block * window), independent of n, on top of the O(cols * n) output.
         """
-        n = len(group_df)
-        times = group_df['snap_time'].to_numpy()
-        outputs = {f"{c}_stdev": np.full(n, np.nan, dtype=float) for c in cols}
-
-        dq = {c: deque() for c in cols}
-        vals = {c: group_df[c].to_numpy() for c in cols}
-
-        for i in range(n):
-            t = times[i]
-            # 1) compute outputs from the current deque (exclude row i)
-            for c in cols:
-                if len(dq[c]) >= window:
-                    arr = np.array(dq[c], dtype=np.float64)
-                    mu = arr.mean()
-                    var = ((arr - mu) ** 2).mean()
-                    stdev = math.sqrt(var)
-                    outputs[f"{c}_stdev"][i] = 0.0 if stdev < eps else stdev # zero out tiny results
-            
-            # 2) update deques using *current* row (for next timestamp's compute)
-            for c in cols:
-                v = vals[c][i]
-                if not np.isnan(v):
-                    dq[c].append(v)
-                    if len(dq[c]) > window:
-                        dq[c].popleft()
-
-        out_df = group_df[['security_id', 'snap_time']].copy()
-        for name, arr in outputs.items():
-            out_df[name] = arr
-        return out_df
+        block = block or RollingPriceStdevCalculator.WINDOW_BLOCK
+        n_windows = x.shape[-1] - window + 1
+        out = np.empty(x.shape[:-1] + (n_windows,))
+        for s in range(0, n_windows, block):
+            out[..., s:s + block] = sliding_window_view(
+                x[..., s:s + block + window - 1], window, axis=-1
+            ).std(axis=-1)
+        return out
+
+    @staticmethod
+    def _column_stdevs(values: np.ndarray, bounds: np.ndarray, window=20, eps=1e-8) -> np.ndarray:
+        """
+        Stdev per row for a (cols, n) block of price columns over all security_ids,
+        on plain NumPy arrays. The columns must share one NaN mask, so the window
+        bookkeeping is done once for all of them.
+        Rows must be grouped by security_id (security g spans rows
+        bounds[g]:bounds[g+1]) and time-ordered within each group.
+        The window at row t is the last `window` valid values of the same security
+        strictly before t (NaNs are skipped, they do not reset the window).
+        """
+        out = np.full(values.shape, np.nan)
+        valid = ~np.isnan(values[0])
+        idx, window_starts = RollingPriceStdevCalculator._get_valid_window_indices(valid, bounds, window)
+        if len(idx) == 0:
+            return out # never enough history, columns stay NaN
+
+        # one rolling pass over the valid values, then a single scatter to the rows
+        rolled = RollingPriceStdevCalculator._window_stdevs(values[:, valid], window)
+        stdev = rolled[:, window_starts]
+        out[:, idx] = np.where(stdev < eps, 0.0, stdev) # zero out tiny results
+        return out
 
     def compute_all(self, start, end, window_size = 20) -> None:
         """
         Full pipeline:
           1) preprocess raw dataframe
           2) build complete hourly grid per security_id in [start, end]
-          3) per security, compute stdev for bid/mid/ask with deques
+          3) compute stdev for bid/mid/ask over the last valid windows, all securities at once
         """
         self._preprocess()
         print("Building hourly calendar and filling gaps...")
         full = self._expand_to_full_grid(start, end)
 
-        print("Computing rolling stdevs with contiguous windows (deque)...")
-        results = []
-        for sec_id, g in full.groupby('security_id', sort=False):
-            g = g.sort_values('snap_time').reset_index(drop=True)
-            out = self._rolling_stdev_with_deques(
-                g, cols=['bid', 'mid', 'ask'], window=window_size
-            )
-            results.append(
-                g.merge(out, on=['security_id', 'snap_time'], how='left')
-            )
-
-        self.result_df = pd.concat(results, ignore_index=True)
+        print("Computing rolling stdevs over the last valid windows...")
+        # pull flat arrays once (SoA); the kernel never touches the DataFrame.
+        # Rows are grouped by security, so groups are contiguous slices between bounds.
+        group_ids, _ = pd.factorize(full['security_id'])
+        bounds = np.flatnonzero(np.r_[True, group_ids[1:] != group_ids[:-1], True])
+        # column views stacked straight into one (cols, n) buffer: a single copy
+        values = np.stack([full[c].to_numpy(dtype=np.float64) for c in self.PRICE_COLS])
+        # Columns with the same NaN mask share one fused kernel pass. Hours added by the
+        # grid are NaN in every column, so usually all three go together; a column with
+        # its own gaps in the source data gets a pass of its own.
+        nan_mask = np.isnan(values)
+        out = np.empty_like(values)
+        remaining = list(range(len(self.PRICE_COLS)))
+        while remaining:
+            same = [i for i in remaining if np.array_equal(nan_mask[i], nan_mask[remaining[0]])]
+            out[same] = self._column_stdevs(values[same], bounds, window_size)
+            remaining = [i for i in remaining if i not in same]
+        self.result_df = full.assign(**{f"{c}_stdev": out[i] for i, c in enumerate(self.PRICE_COLS)})
 
     def save_to_csv(self, output_path: str) -> None:
         """Saves the result DataFrame to a CSV file."""
         if self.result_df is None:
             raise ValueError("No results found. Run compute_all() first.")
-        self.result_df.to_csv(output_path, index=False)
+        # Arrow's multithreaded C++ writer instead of pandas' Python-level row formatter
+        pacsv.write_csv(
+            pa.Table.from_pandas(self.result_df, preserve_index=False), output_path,
+            write_options=pacsv.WriteOptions(batch_size=65536)  # default of 1024 rows per batch is small
+        )
         print(f"Results saved to: {output_path}")
 
 def log_performance(calculator: RollingPriceStdevCalculator, output_path: str, start_time: float) -> None:
@@ -0,0 +1,155 @@
+import math
+import os
+import sys
+import tempfile
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+from calc_rolling_stdev import RollingPriceStdevCalculator
+
+
+def _deque_stdevs(values, window=20, eps=1e-8):
+    """Reference: the original per-row deque implementation for one security."""
+    out = np.full(len(values), np.nan)
+    dq = deque()
+    for i, v in enumerate(values):
+        if len(dq) >= window:
+            arr = np.array(dq, dtype=np.float64)
+            mu = arr.mean()
+            stdev = math.sqrt(((arr - mu) ** 2).mean())
+            out[i] = 0.0 if stdev < eps else stdev
+        if not np.isnan(v):
+            dq.append(v)
+            if len(dq) > window:
+                dq.popleft()
+    return out
+
+
+def _trending_prices(start, stop, jitter, n=200, seed=0):
+    """
+    Hourly prices stepping from start to stop (flat levels of 40 hours) plus
+    jitter, with a few missing snaps. Windows inside a level only see the
+    jitter while the level sits far from the security's overall mean.
+    """
+    rng = np.random.default_rng(seed)
+    levels = np.repeat(np.linspace(start, stop, n // 40), 40)
+    prices = levels + rng.uniform(-jitter, jitter, n)
+    prices[[30, 31, 77, 150]] = np.nan
+    return prices
+
+
+def _kernel_stdevs(prices, window=20):
+    bounds = np.array([0, len(prices)])
+    return RollingPriceStdevCalculator._column_stdevs(prices[None, :], bounds, window)[0]
+
+
+def test_trending_prices_match_deque():
+    for start, stop, jitter in [(50, 150, 1e-4), (50, 150, 1e-9), (1e6, 1e6 + 2.0, 0.01)]:
+        prices = _trending_prices(start, stop, jitter)
+        np.testing.assert_allclose(
+            _kernel_stdevs(prices), _deque_stdevs(prices), rtol=1e-9, atol=0.0, equal_nan=True
+        )
+
+
+def test_securities_at_different_levels_match_deque():
+    # several securities in one pass: windows must not leak across boundaries,
+    # and each security's level must not affect another's precision
+    securities = [
+        _trending_prices(50, 150, 1e-4, seed=1),
+        _trending_prices(1e6, 1e6 + 2.0, 0.01, seed=2),
+        _trending_prices(150, 50, 1e-9, n=160, seed=3),
+    ]
+    values = np.concatenate(securities)
+    bounds = np.cumsum([0] + [len(p) for p in securities])
+    out = RollingPriceStdevCalculator._column_stdevs(values[None, :], bounds)[0]
+    expected = np.concatenate([_deque_stdevs(p) for p in securities])
+    np.testing.assert_allclose(out, expected, rtol=1e-9, atol=0.0, equal_nan=True)
+
+
+def test_tiny_stdev_on_trend_is_zeroed():
+    # steps of 1e-12 on top of a 50 -> 150 drift are far below eps=1e-8
+    prices = np.full(200, 50.0) + np.arange(200) * 1e-12
+    prices[120:] = 150.0
+    out = _kernel_stdevs(prices)
+    assert np.all(out[20:120] == 0.0)
+    assert np.all(out[140:] == 0.0)
+
+
+def test_blocked_windows_match_unblocked():
+    # slab sizes that do and do not divide the window count, and one larger than it
+    rng = np.random.default_rng(4)
+    x = np.vstack([_trending_prices(50, 150, 1e-4, seed=5), rng.normal(100.0, 1.0, 200)])
+    x = x[:, ~np.isnan(x[0])]
+    expected = sliding_window_view(x, 20, axis=-1).std(axis=-1)
+    for block in (1, 7, 20, 64, 1000):
+        out = RollingPriceStdevCalculator._window_stdevs(x, 20, block)
+        np.testing.assert_array_equal(out, expected)
+
+
+def _snap_frame(rng):
+    """
+    Hourly bid/mid/ask snaps for three securities with whole hours missing
+    (grid rows), bid and ask NaN together and mid NaN on hours of its own.
+    """
+    frames = []
+    for sec, level in [('S2', 100.0), ('S1', 1e6), ('S3', 50.0)]:
+        hours = pd.date_range('2021-11-20 00:00', periods=60, freq='h')
+        keep = np.ones(60, dtype=bool)
+        keep[rng.choice(60, 6, replace=False)] = False
+        mid = level + np.cumsum(rng.normal(0.0, 0.01 * level ** 0.5, 60))
+        bid, ask = mid - 0.01, mid + 0.01
+        bid_gaps = rng.choice(60, 4, replace=False)
+        bid[bid_gaps] = ask[bid_gaps] = np.nan
+        mid[rng.choice(60, 5, replace=False)] = np.nan
+        frames.append(pd.DataFrame({
+            'snap_time': hours, 'security_id': sec, 'bid': bid, 'mid': mid, 'ask': ask,
+        })[keep])
+    return pd.concat(frames, ignore_index=True)
+
+
+def _compute_all_on(df, tmp, name, start, end):
+    path = os.path.join(tmp, name)
+    df.to_parquet(path)
+    calc = RollingPriceStdevCalculator(file_path=path)
+    calc.compute_all(start=start, end=end)
+    return calc.result_df
+
+
+def test_compute_all_matches_deque_per_security():
+    # unsorted rows, hours missing from the file, and per-column NaN masks
+    rng = np.random.default_rng(6)
+    snaps = _snap_frame(rng)
+    start, end = '2021-11-20 00:00', '2021-11-22 11:00'
+    hours = pd.date_range(start, end, freq='h')
+
+    expected = []
+    for sec, g in snaps.groupby('security_id'):
+        g = g.set_index('snap_time').reindex(hours)
+        stdevs = {f"{c}_stdev": _deque_stdevs(g[c].to_numpy()) for c in RollingPriceStdevCalculator.PRICE_COLS}
+        expected.append(pd.DataFrame({'snap_time': hours, 'security_id': sec, **stdevs}))
+    expected = pd.concat(expected, ignore_index=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shuffled = _compute_all_on(snaps.sample(frac=1.0, random_state=7), tmp, 'shuffled.parq', start, end)
+        presorted = _compute_all_on(snaps.sort_values(['security_id', 'snap_time']), tmp, 'sorted.parq', start, end)
+
+    for result in (shuffled, presorted):
+        assert list(result['security_id'].astype(str)) == list(expected['security_id'])
+        assert (result['snap_time'].to_numpy() == expected['snap_time'].to_numpy()).all()
+        for col in expected.columns[2:]:
+            np.testing.assert_allclose(
+                result[col].to_numpy(), expected[col].to_numpy(), rtol=1e-9, atol=0.0, equal_nan=True
+            )
+
+
+if __name__ == '__main__':
+    test_trending_prices_match_deque()
+    test_securities_at_different_levels_match_deque()
+    test_tiny_stdev_on_trend_is_zeroed()
+    test_blocked_windows_match_unblocked()
+    test_compute_all_matches_deque_per_security()
+    print("OK")